@@ -1,14 +1,38 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
 import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongoarrow.api import Schema, find_arrow_all
 import os
+import re
+
+BOOK_SCHEMA = pa.schema([
+    ("Title", pa.string()),
+    ("Author", pa.string()),
+    ("Purchased", pa.string()),
+    ("Read", pa.string()),
+    ("Rating", pa.int64()),
+    ("Notes", pa.string()),
+])
+BOOK_COLUMNS = BOOK_SCHEMA.names
+# Values for fields an imported row leaves out when it creates a new book
+BOOK_DEFAULTS = {"Author": "", "Purchased": "", "Read": "No", "Rating": 3, "Notes": ""}
+# Only ship the fields the app displays back from the server
+BOOK_PROJECTION = {"_id": 0, **{col: 1 for col in BOOK_COLUMNS}}
+# Rows per page of the library table
+PAGE_SIZE = 50
 
 # --- DATABASE CONNECTION ---
+# Cached as a resource so the client (and its connection pool) survives reruns
+# instead of redoing the TLS handshake on every widget interaction.
+@st.cache_resource
 def get_database():
     # 1. Try to get the URI from Streamlit Secrets (Web Environment)
     try:
         uri = st.secrets["MONGO_URI"]
-    except:
+    except (KeyError, FileNotFoundError, st.errors.StreamlitSecretNotFoundError):
         # 2. Fallback for local testing (checks your computer's environment variables)
         # You can also paste your string here temporarily for local testing, 
         # but don't commit it to GitHub.
@@ -19,27 +43,148 @@ def get_database():
         st.stop()
 
     # Connect using the URI
-    client = pymongo.MongoClient(uri)
+    client = pymongo.MongoClient(
+        uri,
+        maxPoolSize=10,
+        serverSelectionTimeoutMS=5000,
+        appname="glm5-library",
+    )
     
     # Create/Switch to a NEW database specifically for this app
     # This ensures we don't mix data with your 'WordInfo' database
     return client["library_db"]
 
+@st.cache_resource
+def get_collection():
+    # Create/Switch to the 'books' collection inside 'library_db'
+    collection = get_database()["books"]
+    # Lookups/updates/deletes all go by Title, so index it (and keep titles unique)
+    try:
+        collection.create_index("Title", unique=True, background=True)
+    except DuplicateKeyError:
+        st.warning("Some titles are duplicated, so the unique Title index was not created.")
+    # One-time migration: ratings used to be stored as "⭐⭐⭐" strings, now they are ints
+    collection.update_many(
+        {"Rating": {"$type": "string"}},
+        [{"$set": {"Rating": {"$strLenCP": "$Rating"}}}],
+    )
+    return collection
+
 # --- HELPER FUNCTIONS ---
-def load_data(collection):
-    data = list(collection.find({}, {'_id': 0}))
-    if not data:
-        return pd.DataFrame(columns=["Title", "Author", "Purchased", "Read", "Rating", "Notes"])
-    return pd.DataFrame(data)
+# Decodes the BSON straight into an Arrow table (in C) rather than building a
+# list of dicts first; text columns stay Arrow-backed strings. The schema also
+# sets the projection, and a cell of an unexpected type comes back as null
+# instead of failing the whole table.
+def fetch_frame(collection, query, **kwargs):
+    table = find_arrow_all(
+        collection, query, schema=Schema.from_arrow(BOOK_SCHEMA), allow_invalid=True, **kwargs
+    )
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+# Case-insensitive substring match over the text columns, the same semantics
+# as the original client-side search, run on the server so only matches come
+# back. The term is escaped, so it is always matched literally.
+def search_query(search_term):
+    if not search_term:
+        return {}
+    pattern = {"$regex": re.escape(search_term), "$options": "i"}
+    clauses = [{field: pattern} for field in ("Title", "Author", "Purchased", "Read", "Notes")]
+    term = search_term.strip()
+    if term.isdecimal() and 1 <= int(term) <= 5:
+        # Ratings are ints now, so a bare 1-5 also finds books with that rating
+        clauses.append({"Rating": int(term)})
+    return {"$or": clauses}
+
+# Only one page of books is fetched and sent to the browser at a time.
+# The leading underscore tells Streamlit not to hash the Collection argument;
+# call clear_caches() after any write so the next run refetches.
+@st.cache_data(ttl=60, show_spinner=False)
+def load_page(_collection, search_term, page):
+    return fetch_frame(
+        _collection, search_query(search_term), sort=[("_id", 1)], skip=(page - 1) * PAGE_SIZE, limit=PAGE_SIZE
+    )
+
+# The unfiltered total comes from collection metadata instead of a scan
+@st.cache_data(ttl=60, show_spinner=False)
+def count_books(_collection, search_term):
+    if not search_term:
+        return _collection.estimated_document_count()
+    return _collection.count_documents(search_query(search_term))
+
+# Titles for the edit picker, found with the same server-side search and
+# capped at one page so the whole library never goes to the browser. Fetches
+# one extra title so the caller can tell whether more matches exist.
+@st.cache_data(ttl=60, show_spinner=False)
+def find_titles(_collection, search_term):
+    cursor = _collection.find(search_query(search_term), {"_id": 0, "Title": 1})
+    return [doc["Title"] for doc in cursor.sort("Title", 1).limit(PAGE_SIZE + 1)]
+
+# A single book by Title, which the unique index answers directly
+@st.cache_data(ttl=60, show_spinner=False)
+def load_book(_collection, title):
+    return _collection.find_one({"Title": title}, BOOK_PROJECTION)
+
+def clear_caches():
+    load_page.clear()
+    count_books.clear()
+    find_titles.clear()
+    load_book.clear()
 
 def save_book(collection, book_data):
     collection.insert_one(book_data)
 
+# Batch writes: one round trip for the whole list instead of one per book
+def save_books(collection, books):
+    if books:
+        collection.insert_many(books, ordered=False)
+
+def update_books(collection, updates):
+    if updates:
+        collection.bulk_write(
+            [UpdateOne({"Title": title}, {"$set": data}) for title, data in updates],
+            ordered=False,
+        )
+
+# Each book only carries the columns the CSV has and the cells that aren't
+# blank, so updating an existing title never overwrites fields it left out.
+# Raises ValueError with a message for the user if the file can't be used.
+def read_books_csv(file):
+    try:
+        books = pd.read_csv(file, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("Couldn't read the CSV, please save it as UTF-8.")
+    except pd.errors.EmptyDataError:
+        raise ValueError("The CSV is empty.")
+    except pd.errors.ParserError:
+        raise ValueError("Couldn't parse the CSV, please check its format.")
+    if "Title" not in books:
+        raise ValueError("CSV needs a Title column.")
+    books = books[[col for col in BOOK_COLUMNS if col in books]]
+    if "Rating" in books:
+        # Whole stars only (2.5 rounds up), clipped to the 1-5 the sliders allow
+        rating = pd.to_numeric(books["Rating"], errors="coerce").add(0.5).floordiv(1).clip(1, 5)
+        books = books.assign(Rating=rating.astype("Int64"))
+    records = []
+    for row in books.to_dict(orient="records"):
+        book = {col: value for col, value in row.items() if not pd.isna(value) and value != ""}
+        if book.get("Title"):
+            records.append(book)
+    return records
+
+# Both return how many books matched, 0 if the title was removed elsewhere
 def delete_book(collection, title):
-    collection.delete_one({"Title": title})
+    return collection.delete_one({"Title": title}).deleted_count
 
 def update_book(collection, old_title, new_data):
-    collection.update_one({"Title": old_title}, {"$set": new_data})
+    return collection.update_one({"Title": old_title}, {"$set": new_data}).matched_count
+
+# Messages that need to survive the app-scoped st.rerun() after a write
+def flash(kind, message):
+    st.session_state.setdefault("flash", []).append((kind, message))
+
+def show_flashes():
+    for kind, message in st.session_state.pop("flash", []):
+        getattr(st, kind)(message)
 
 # --- APP LAYOUT ---
 st.set_page_config(page_title="My Library", page_icon="📚", layout="wide")
@@ -48,15 +193,16 @@ st.title("📚 Personal Library Tracker")
 st.write("Securely hosted on MongoDB Atlas.")
 
 # Connect to DB
-db = get_database()
-# Create/Switch to the 'books' collection inside 'library_db'
-collection = db["books"]
+collection = get_collection()
 
-# Load current data
-df = load_data(collection)
+show_flashes()
 
 # --- SIDEBAR: ADD NEW BOOK ---
-with st.sidebar:
+# The page is split into fragments so a widget only reruns the section it
+# lives in. Writes still rerun the whole app (scope="app") because the other
+# fragments have to show the change; that rerun only refetches one page.
+@st.fragment
+def add_form(collection):
     st.header("Add a New Book")
     with st.form("book_form", clear_on_submit=True):
         title = st.text_input("Title*")
@@ -74,66 +220,127 @@ with st.sidebar:
                 "Author": author,
                 "Purchased": purchased,
                 "Read": "Yes" if read else "No",
-                "Rating": f"{'⭐' * rating}",
+                "Rating": rating,
                 "Notes": notes
             }
-            save_book(collection, new_book)
-            st.success(f"Added '{title}'!")
-            st.rerun()
+            try:
+                save_book(collection, new_book)
+            except DuplicateKeyError:
+                st.error(f"'{title}' is already in your library.")
+            else:
+                flash("success", f"Added '{title}'!")
+                clear_caches()
+                st.rerun()
         elif submitted and not title:
             st.error("Title is required.")
 
+    st.header("Import CSV")
+    uploaded = st.file_uploader("Books CSV", type="csv")
+    if uploaded and st.button("Import Books"):
+        try:
+            books = read_books_csv(uploaded)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        titles = [book["Title"] for book in books]
+        existing = {doc["Title"] for doc in collection.find({"Title": {"$in": titles}}, {"_id": 0, "Title": 1})}
+        # Titles already in the library are updated, the rest are inserted
+        updates = [(book["Title"], book) for book in books if book["Title"] in existing]
+        new_books = [{**BOOK_DEFAULTS, **book} for book in books if book["Title"] not in existing]
+        update_books(collection, updates)
+        try:
+            save_books(collection, new_books)
+        except BulkWriteError as e:
+            # Unordered, so everything but the duplicate titles still went in.
+            # Existing titles were routed to the update above, so these are
+            # titles repeated within the CSV (or added by someone meanwhile).
+            errors = e.details["writeErrors"]
+            if any(error["code"] != 11000 for error in errors):
+                raise
+            skipped = len(errors)
+        else:
+            skipped = 0
+        clear_caches()
+        flash("success", f"Added {len(new_books) - skipped} books and updated {len(updates)}!")
+        if skipped:
+            flash("error", f"Skipped {skipped} rows whose title was already imported from earlier in the CSV.")
+        st.rerun()
+
 # --- MAIN AREA: SEARCH AND VIEW ---
-search_term = st.text_input("🔍 Search", "")
+@st.fragment
+def library_view(collection):
+    search_term = st.text_input("🔍 Search", "")
 
-if search_term:
-    mask = df.apply(lambda row: row.astype(str).str.lower().str.contains(search_term.lower()).any(), axis=1)
-    display_df = df[mask]
-else:
-    display_df = df
+    total = count_books(collection, search_term)
+    st.subheader(f"Library ({total} books)")
+    page_count = max(1, -(-total // PAGE_SIZE))
+    page = st.number_input("Page", min_value=1, max_value=page_count, value=1)
+    display_df = load_page(collection, search_term, page)
 
-st.subheader(f"Library ({len(display_df)} books)")
-st.dataframe(display_df, use_container_width=True, hide_index=True)
+    st.dataframe(
+        display_df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={"Rating": st.column_config.NumberColumn("Rating", format="%d ⭐")},
+    )
 
 # --- EDIT / DELETE SECTION ---
-st.divider()
-st.subheader("Edit or Delete")
+@st.fragment
+def edit_panel(collection):
+    st.divider()
+    st.subheader("Edit or Delete")
 
-if not df.empty:
-    book_titles = df["Title"].tolist()
-    selected_title = st.selectbox("Select Book", options=book_titles)
+    edit_search = st.text_input("Find Book", placeholder="Filter by title, author, notes...")
+    book_titles = find_titles(collection, edit_search)
+    if len(book_titles) > PAGE_SIZE:
+        book_titles = book_titles[:PAGE_SIZE]
+        st.caption(f"Showing the first {PAGE_SIZE} matches, narrow it down to see more.")
 
-    if selected_title:
-        current_data = df[df["Title"] == selected_title].iloc[0]
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            edit_author = st.text_input("Author", value=current_data["Author"])
-            edit_purchased = st.text_input("Purchased At", value=current_data["Purchased"])
-        
-        with col2:
-            is_read = current_data["Read"] == "Yes"
-            edit_read = st.checkbox("Read?", value=is_read)
-            current_rating = current_data["Rating"].count("⭐")
-            edit_rating = st.select_slider("Rating", options=[1, 2, 3, 4, 5], value=current_rating)
+    if book_titles:
+        selected_title = st.selectbox("Select Book", options=book_titles)
+        current_data = load_book(collection, selected_title)
 
-        edit_notes = st.text_area("Notes", value=current_data["Notes"])
+        if current_data:
+            col1, col2 = st.columns(2)
+            with col1:
+                edit_author = st.text_input("Author", value=current_data.get("Author"))
+                edit_purchased = st.text_input("Purchased At", value=current_data.get("Purchased"))
+            
+            with col2:
+                is_read = current_data.get("Read") == "Yes"
+                edit_read = st.checkbox("Read?", value=is_read)
+                current_rating = min(max(int(current_data.get("Rating") or 3), 1), 5)
+                edit_rating = st.select_slider("Rating", options=[1, 2, 3, 4, 5], value=current_rating)
 
-        btn_col1, btn_col2 = st.columns(2)
-        
-        if btn_col1.button("💾 Update Book", use_container_width=True):
-            updated_data = {
-                "Author": edit_author,
-                "Purchased": edit_purchased,
-                "Read": "Yes" if edit_read else "No",
-                "Rating": f"{'⭐' * edit_rating}",
-                "Notes": edit_notes
-            }
-            update_book(collection, selected_title, updated_data)
-            st.success("Updated!")
-            st.rerun()
-
-        if btn_col2.button("🗑️ Delete Book", use_container_width=True, type="primary"):
-            delete_book(collection, selected_title)
-            st.warning("Deleted!")
-            st.rerun()
\ No newline at end of file
+            edit_notes = st.text_area("Notes", value=current_data.get("Notes"))
+
+            btn_col1, btn_col2 = st.columns(2)
+            
+            if btn_col1.button("💾 Update Book", use_container_width=True):
+                updated_data = {
+                    "Author": edit_author,
+                    "Purchased": edit_purchased,
+                    "Read": "Yes" if edit_read else "No",
+                    "Rating": edit_rating,
+                    "Notes": edit_notes
+                }
+                if update_book(collection, selected_title, updated_data):
+                    flash("success", "Updated!")
+                else:
+                    flash("error", f"'{selected_title}' is no longer in your library.")
+                clear_caches()
+                st.rerun()
+
+            if btn_col2.button("🗑️ Delete Book", use_container_width=True, type="primary"):
+                if delete_book(collection, selected_title):
+                    flash("warning", "Deleted!")
+                else:
+                    flash("error", f"'{selected_title}' is no longer in your library.")
+                clear_caches()
+                st.rerun()
+
+# --- RENDER ---
+with st.sidebar:
+    add_form(collection)
+library_view(collection)
+edit_panel(collection)